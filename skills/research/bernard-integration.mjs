@@ -189,6 +189,11 @@ if (command === "test-similarity") {
 
   const score = semanticSimilarity(text1, text2);
   console.log(`Similarity: ${score.toFixed(3)}`);
+} else if (command === "test-similarity-batch") {
+  // Reads [[text1, text2], ...] as JSON on stdin, prints [score, ...]
+  const pairs = JSON.parse(fs.readFileSync(0, "utf8"));
+  const scores = pairs.map(([text1, text2]) => semanticSimilarity(text1, text2));
+  console.log(JSON.stringify(scores));
 } else if (command === "test-extract") {
   const mockResults = {
     results: [
@@ -7,15 +7,103 @@ This runs inside a Bernard session and bridges to the orchestrator.
 Handles actual tool calls (web_search, cron, message, etc.)
 """
 
+import fcntl
+import hashlib
 import json
 import os
+import re
+import shutil
 import subprocess
 import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 SKILL_DIR = Path(__file__).parent
 WORKSPACE = Path(os.environ.get('OPENCLAW_WORKSPACE', Path.home() / '.openclaw' / 'workspace'))
 RESEARCH_DIR = WORKSPACE / 'research'
+SEARCH_CACHE_DIR = RESEARCH_DIR / '.cache'
+SEARCH_CACHE_TTL = 24 * 60 * 60  # seconds
+SEARCH_CONCURRENCY = 8
+SIMILARITY_THRESHOLD = 0.5
+
+# Two or more consecutive whitespace-separated words starting with a capital
+TOPIC_PHRASE_RE = re.compile(r'(?<!\S)[A-Z]\S*(?:\s+[A-Z]\S*)+')
+
+class ResearchBusy(Exception):
+    """Another phase already holds the lock on this research project"""
+
+class ResearchSession:
+    """
+    A research project's state.json, loaded once and held under an exclusive
+    lock for the duration of a phase. Written back on a clean exit.
+    Raises ResearchBusy on enter if another phase is still running.
+    
+    Each phase runs as its own cron-triggered process, so this is still one
+    parse and one write per phase; what the session adds is the lock and a
+    single write-back point.
+    """
+    
+    def __init__(self, slug):
+        self.slug = slug
+        self.path = RESEARCH_DIR / slug
+        self.state_path = self.path / 'state.json'
+        self.state = None
+        self._file = None
+        self._data = None
+    
+    def __enter__(self):
+        self._file = open(self.state_path, 'r+b')
+        try:
+            try:
+                fcntl.flock(self._file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                raise ResearchBusy(self.slug) from None
+            self._data = self._file.read()
+            self.state = orjson.loads(self._data) if orjson is not None else json.loads(self._data)
+        except BaseException:
+            self._file.close()
+            raise
+        return self
+    
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            if exc_type is None:
+                if orjson is not None:
+                    data = orjson.dumps(self.state, option=orjson.OPT_INDENT_2)
+                else:
+                    data = json.dumps(self.state, indent=2).encode()
+                # Leave the file (and its mtime) alone when nothing changed
+                if data != self._data:
+                    self._file.seek(0)
+                    self._file.truncate()
+                    self._file.write(data)
+        finally:
+            # Closing the file also releases the lock
+            self._file.close()
+        return False
+
+def write_if_changed(path, text):
+    """
+    Write text to path unless the file already holds exactly that content
+    New content goes to a temp file first and is renamed into place
+    """
+    data = text.encode()
+    try:
+        if path.read_bytes() == data:
+            return False
+    except FileNotFoundError:
+        pass
+    
+    tmp_path = path.with_name(path.name + '.tmp')
+    tmp_path.write_bytes(data)
+    os.replace(tmp_path, path)
+    return True
 
 def web_search(query, count=10):
     """
@@ -31,56 +119,106 @@ def web_search(query, count=10):
         'results': []
     }
 
-def semantic_similarity(text1, text2):
+def web_search_cached(query, count=10):
     """
-    Use QMD for semantic similarity via the integration layer
+    Call web_search, reusing results cached on disk within SEARCH_CACHE_TTL
+    Tier 2 and tier 3 topics overlap heavily, so the same query recurs
     """
+    key = hashlib.sha1(f"{query}|{count}".encode()).hexdigest()
+    cache_path = SEARCH_CACHE_DIR / f'{key}.json'
+    
+    try:
+        if time.time() - cache_path.stat().st_mtime < SEARCH_CACHE_TTL:
+            return json.loads(cache_path.read_text())
+        # Expired: drop it so the cache doesn't grow forever
+        cache_path.unlink(missing_ok=True)
+    except (OSError, ValueError):
+        pass
+    
+    search_results = web_search(query, count)
+    
+    # An empty result is more likely a failed search than a real answer;
+    # don't pin it for a whole TTL
+    if not search_results.get('results'):
+        return search_results
+    
+    # The cache is shared across slugs and phase processes, so never let a
+    # reader see a half-written entry
+    SEARCH_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    tmp_path = cache_path.with_name(f'{cache_path.name}.{os.getpid()}.tmp')
+    tmp_path.write_text(json.dumps(search_results))
+    os.replace(tmp_path, cache_path)
+    
+    return search_results
+
+def search_many(queries, count=10):
+    """
+    Run web_search_cached for each query concurrently
+    Returns results in the same order as queries
+    """
+    unique = list(dict.fromkeys(queries))
+    if not unique:
+        return []
+    
+    with ThreadPoolExecutor(max_workers=min(SEARCH_CONCURRENCY, len(unique))) as executor:
+        found = dict(zip(unique, executor.map(lambda q: web_search_cached(q, count), unique)))
+    
+    return [found[query] for query in queries]
+
+def batch_similarity(pairs):
+    """
+    Score many (text1, text2) pairs with a single integration-layer call
+    Avoids paying Node startup once per comparison
+    Returns None if scoring failed, so callers can tell it apart from low scores
+    """
+    if not pairs:
+        return []
+    
     try:
         result = subprocess.run(
-            ['node', str(SKILL_DIR / 'bernard-integration.js'), 'test-similarity', text1, text2],
+            ['node', str(SKILL_DIR / 'bernard-integration.mjs'), 'test-similarity-batch'],
+            input=json.dumps(pairs),
             capture_output=True,
             text=True,
             check=True
         )
         
-        # Parse the similarity score from output
-        for line in result.stdout.split('\n'):
-            if 'Similarity:' in line:
-                score = float(line.split(':')[1].strip())
-                return score
-        
-        return 0.0
-    except Exception as e:
+        scores = json.loads(result.stdout)
+    except (OSError, subprocess.CalledProcessError, ValueError) as e:
         print(f"[SIMILARITY] Error: {e}", file=sys.stderr)
-        return 0.0
+        return None
+    
+    # Scores are split and zipped positionally, so a short list would misalign them
+    if not isinstance(scores, list) or len(scores) != len(pairs):
+        print(f"[SIMILARITY] Error: expected {len(pairs)} scores, got {scores!r}", file=sys.stderr)
+        return None
+    
+    # The JS side passes QMD scores through unchecked, so null can appear
+    return [
+        float(score) if isinstance(score, (int, float)) else 0.0
+        for score in scores
+    ]
 
-def extract_topics(search_results):
+def extract_topics(search_results, limit=10):
     """
     Extract topics from search results
+    Stops scanning once `limit` distinct topics have been found
     """
-    topics = set()
+    # dict rather than set: keeps topics in the order they were found
+    topics = {}
     
     for result in search_results.get('results', []):
         title = result.get('title', '')
         snippet = result.get('snippet', '')
         
         # Basic topic extraction
-        # Look for capitalized phrases, key concepts
-        words = (title + ' ' + snippet).split()
-        
-        current_phrase = []
-        for word in words:
-            if word and word[0].isupper():
-                current_phrase.append(word)
-            else:
-                if len(current_phrase) >= 2:
-                    topics.add(' '.join(current_phrase))
-                current_phrase = []
-        
-        if len(current_phrase) >= 2:
-            topics.add(' '.join(current_phrase))
+        # Look for runs of two or more capitalized words
+        for match in TOPIC_PHRASE_RE.finditer(title + ' ' + snippet):
+            topics[' '.join(match.group().split())] = None
+            if len(topics) >= limit:
+                return list(topics)
     
-    return list(topics)[:10]
+    return list(topics)
 
 def schedule_phase(phase, slug, delay_minutes, metadata):
     """
@@ -103,12 +241,12 @@ def deliver_results(slug, metadata):
     """
     compiled_path = RESEARCH_DIR / slug / 'compiled.md'
     
-    if not compiled_path.exists():
+    try:
+        compiled = compiled_path.read_text()
+    except FileNotFoundError:
         print(f"[DELIVER] Error: compiled.md not found at {compiled_path}", file=sys.stderr)
         return False
     
-    compiled = compiled_path.read_text()
-    
     print(f"[DELIVER] Sending to channel: {metadata.get('channel')}", file=sys.stderr)
     
     # Pseudocode - would use message tool
@@ -120,15 +258,14 @@ def deliver_results(slug, metadata):
     
     return True
 
-def run_tier1(slug):
+def run_tier1(session):
     """Execute tier 1 research"""
-    state_path = RESEARCH_DIR / slug / 'state.json'
-    state = json.loads(state_path.read_text())
+    state = session.state
     
     topic = state['topic']
     
     # Perform search
-    search_results = web_search(topic, count=10)
+    search_results = web_search_cached(topic, count=10)
     
     # Extract subtopics
     subtopics = extract_topics(search_results)
@@ -137,38 +274,32 @@ def run_tier1(slug):
     state['tier1Topics'] = subtopics
     state['phase'] = 'tier1-complete'
     
-    # Write tier1.md
-    tier1_path = RESEARCH_DIR / slug / 'tier1.md'
-    tier1_content = f"""# Tier 1 Research: {topic}
-
-## Search Results
-
-{json.dumps(search_results, indent=2)}
-
-## Extracted Subtopics
-
-{chr(10).join(f'- {topic}' for topic in subtopics)}
-"""
-    tier1_path.write_text(tier1_content)
+    # Keep the raw search payload out of tier1.md so compile doesn't copy it
+    write_if_changed(session.path / 'tier1_raw.json', json.dumps(search_results, indent=2))
     
-    # Save state
-    state_path.write_text(json.dumps(state, indent=2))
+    # Write tier1.md
+    parts = [
+        f"# Tier 1 Research: {topic}\n\n## Search Results\n\n",
+        f"See tier1_raw.json ({len(search_results.get('results', []))} results)\n",
+        "\n## Extracted Subtopics\n\n",
+    ]
+    parts.extend(f"- {subtopic}\n" for subtopic in subtopics)
+    write_if_changed(session.path / 'tier1.md', ''.join(parts))
     
     # Schedule tier 2
-    schedule_phase('tier2', slug, 5, state.get('metadata', {}))
+    schedule_phase('tier2', session.slug, 5, state.get('metadata', {}))
     
     print(f"[TIER1] Complete. Found {len(subtopics)} subtopics.")
     return True
 
-def run_tier2(slug):
+def run_tier2(session):
     """Execute tier 2 research"""
-    state_path = RESEARCH_DIR / slug / 'state.json'
-    state = json.loads(state_path.read_text())
+    state = session.state
     
     tier2_topics = []
     
-    for subtopic in state['tier1Topics']:
-        search_results = web_search(subtopic, count=5)
+    subtopics = state['tier1Topics']
+    for subtopic, search_results in zip(subtopics, search_many(subtopics, count=5)):
         tertiary = extract_topics(search_results)
         
         tier2_topics.append({
@@ -180,97 +311,117 @@ def run_tier2(slug):
     # Update state
     state['tier2Topics'] = tier2_topics
     state['phase'] = 'tier2-complete'
+    # Scores from an earlier tier3 run belong to the old branches
+    state.pop('tier2Similarity', None)
     
     # Write tier2.md
-    tier2_path = RESEARCH_DIR / slug / 'tier2.md'
-    tier2_content = f"""# Tier 2 Research: Subtopic Expansion
-
-{chr(10).join(f'## {item["subtopic"]}{chr(10)}{chr(10)}Tertiary topics:{chr(10)}{chr(10).join(f"- {t}" for t in item["tertiaryTopics"])}' for item in tier2_topics)}
-"""
-    tier2_path.write_text(tier2_content)
-    
-    # Save state
-    state_path.write_text(json.dumps(state, indent=2))
+    parts = ["# Tier 2 Research: Subtopic Expansion\n\n"]
+    for item in tier2_topics:
+        parts.append(f"## {item['subtopic']}\n\nTertiary topics:\n")
+        parts.extend(f"- {t}\n" for t in item['tertiaryTopics'])
+        parts.append("\n")
+    write_if_changed(session.path / 'tier2.md', ''.join(parts))
     
     # Schedule tier 3
-    schedule_phase('tier3', slug, 5, state.get('metadata', {}))
+    schedule_phase('tier3', session.slug, 5, state.get('metadata', {}))
     
     print(f"[TIER2] Complete. Expanded to {len(tier2_topics)} branches.")
     return True
 
-def run_tier3(slug):
+def run_tier3(session):
     """Execute tier 3 research"""
-    state_path = RESEARCH_DIR / slug / 'state.json'
-    state = json.loads(state_path.read_text())
+    state = session.state
     
     tier3_topics = []
     
-    for branch in state['tier2Topics']:
-        for tertiary in branch['tertiaryTopics']:
-            search_results = web_search(tertiary, count=5)
-            
-            tier3_topics.append({
-                'parentSubtopic': branch['subtopic'],
-                'topic': tertiary,
-                'searchResults': search_results
-            })
+    # Score tier2 branches up front; compile would prune the weak ones anyway,
+    # so their tertiary topics are not worth searching
+    tier2_scores = batch_similarity(
+        [(state['topic'], branch['subtopic']) for branch in state['tier2Topics']]
+    )
+    
+    if tier2_scores is None:
+        # Scoring failed, not "irrelevant": search everything and let compile rescore
+        print("[PRUNE] Similarity unavailable, searching all tier2 branches", file=sys.stderr)
+        state.pop('tier2Similarity', None)
+        kept_tier2 = state['tier2Topics']
+    else:
+        state['tier2Similarity'] = tier2_scores
+        kept_tier2 = []
+        for branch, similarity in zip(state['tier2Topics'], tier2_scores):
+            if similarity >= SIMILARITY_THRESHOLD:
+                kept_tier2.append(branch)
+            else:
+                print(f"[PRUNE] Skipping tier3 for: {branch['subtopic']} (similarity: {similarity:.2f})")
+    
+    branches = [
+        (branch['subtopic'], tertiary)
+        for branch in kept_tier2
+        for tertiary in branch['tertiaryTopics']
+    ]
+    all_results = search_many([tertiary for _, tertiary in branches], count=5)
+    
+    for (parent, tertiary), search_results in zip(branches, all_results):
+        tier3_topics.append({
+            'parentSubtopic': parent,
+            'topic': tertiary,
+            'searchResults': search_results
+        })
     
     # Update state
     state['tier3Topics'] = tier3_topics
     state['phase'] = 'tier3-complete'
     
     # Write tier3.md
-    tier3_path = RESEARCH_DIR / slug / 'tier3.md'
-    tier3_content = f"""# Tier 3 Research: Deep Dive
-
-{chr(10).join(f'## {item["topic"]}{chr(10)}{chr(10)}Parent: {item["parentSubtopic"]}{chr(10)}' for item in tier3_topics)}
-"""
-    tier3_path.write_text(tier3_content)
-    
-    # Save state
-    state_path.write_text(json.dumps(state, indent=2))
+    parts = ["# Tier 3 Research: Deep Dive\n\n"]
+    parts.extend(
+        f"## {item['topic']}\n\nParent: {item['parentSubtopic']}\n\n"
+        for item in tier3_topics
+    )
+    write_if_changed(session.path / 'tier3.md', ''.join(parts))
     
     # Schedule compilation
-    schedule_phase('compile', slug, 5, state.get('metadata', {}))
+    schedule_phase('compile', session.slug, 5, state.get('metadata', {}))
     
     print(f"[TIER3] Complete. Researched {len(tier3_topics)} tertiary topics.")
     return True
 
-def run_compile(slug):
+def run_compile(session):
     """Execute compilation with semantic pruning"""
-    state_path = RESEARCH_DIR / slug / 'state.json'
-    state = json.loads(state_path.read_text())
+    state = session.state
     
     original_topic = state['topic']
     
+    # Score every tier3 topic (and tier2, unless tier3 already did) in one batch
+    tier2_count = len(state['tier2Topics'])
+    tier2_scores = state.get('tier2Similarity')
+    pairs = [(original_topic, item['topic']) for item in state['tier3Topics']]
+    if tier2_scores is None or len(tier2_scores) != tier2_count:
+        pairs = [(original_topic, branch['subtopic']) for branch in state['tier2Topics']] + pairs
+        # A failed scoring call counts every topic as unrelated, as before
+        scores = batch_similarity(pairs) or [0.0] * len(pairs)
+        tier2_scores, tier3_scores = scores[:tier2_count], scores[tier2_count:]
+    else:
+        tier3_scores = batch_similarity(pairs) or [0.0] * len(pairs)
+    
     # Prune tier2 topics
     pruned_tier2 = []
-    for branch in state['tier2Topics']:
-        similarity = semantic_similarity(original_topic, branch['subtopic'])
-        if similarity >= 0.5:
+    for branch, similarity in zip(state['tier2Topics'], tier2_scores):
+        if similarity >= SIMILARITY_THRESHOLD:
             pruned_tier2.append(branch)
         else:
             print(f"[PRUNE] Removed tier2: {branch['subtopic']} (similarity: {similarity:.2f})")
     
     # Prune tier3 topics
     pruned_tier3 = []
-    for item in state['tier3Topics']:
-        similarity = semantic_similarity(original_topic, item['topic'])
-        if similarity >= 0.5:
+    for item, similarity in zip(state['tier3Topics'], tier3_scores):
+        if similarity >= SIMILARITY_THRESHOLD:
             pruned_tier3.append(item)
         else:
             print(f"[PRUNE] Removed tier3: {item['topic']} (similarity: {similarity:.2f})")
     
     # Compile final document
-    tier1_path = RESEARCH_DIR / slug / 'tier1.md'
-    tier2_path = RESEARCH_DIR / slug / 'tier2.md'
-    tier3_path = RESEARCH_DIR / slug / 'tier3.md'
-    
-    tier1_content = tier1_path.read_text() if tier1_path.exists() else ''
-    tier2_content = tier2_path.read_text() if tier2_path.exists() else ''
-    tier3_content = tier3_path.read_text() if tier3_path.exists() else ''
-    
-    compiled = f"""# Research: {original_topic}
+    header = f"""# Research: {original_topic}
 
 **Completed:** {state.get('completedAt', 'now')}
 
@@ -281,34 +432,37 @@ def run_compile(slug):
 This research explored {original_topic} across three tiers of investigation.
 After semantic pruning, {len(pruned_tier2)} of {len(state['tier2Topics'])} tier-2 topics
 and {len(pruned_tier3)} of {len(state['tier3Topics'])} tier-3 topics were retained.
-
----
-
-{tier1_content}
-
----
-
-{tier2_content}
-
----
-
-{tier3_content}
 """
     
-    # Write compiled output
-    compiled_path = RESEARCH_DIR / slug / 'compiled.md'
-    compiled_path.write_text(compiled)
+    # Copy the tier files straight through as bytes rather than decoding them
+    compiled_path = session.path / 'compiled.md'
+    with open(compiled_path, 'wb') as compiled:
+        compiled.write(header.encode())
+        for tier in ('tier1', 'tier2', 'tier3'):
+            compiled.write(b'\n---\n\n')
+            try:
+                with open(session.path / f'{tier}.md', 'rb') as tier_file:
+                    shutil.copyfileobj(tier_file, compiled)
+            except FileNotFoundError:
+                pass
+            compiled.write(b'\n')
     
     # Update state
     state['phase'] = 'complete'
-    state_path.write_text(json.dumps(state, indent=2))
     
     # Deliver results
-    deliver_results(slug, state.get('metadata', {}))
+    deliver_results(session.slug, state.get('metadata', {}))
     
     print(f"[COMPILE] Complete. Document: {compiled_path}")
     return True
 
+PHASES = {
+    'tier1': run_tier1,
+    'tier2': run_tier2,
+    'tier3': run_tier3,
+    'compile': run_compile,
+}
+
 if __name__ == '__main__':
     if len(sys.argv) < 3:
         print("Usage: research-handler.py [tier1|tier2|tier3|compile] [slug]")
@@ -317,14 +471,14 @@ if __name__ == '__main__':
     command = sys.argv[1]
     slug = sys.argv[2]
     
-    if command == 'tier1':
-        run_tier1(slug)
-    elif command == 'tier2':
-        run_tier2(slug)
-    elif command == 'tier3':
-        run_tier3(slug)
-    elif command == 'compile':
-        run_compile(slug)
-    else:
+    handler = PHASES.get(command)
+    if handler is None:
         print(f"Unknown command: {command}")
         sys.exit(1)
+    
+    try:
+        with ResearchSession(slug) as session:
+            handler(session)
+    except ResearchBusy:
+        print(f"[{command.upper()}] {slug} already running")
+        sys.exit(0)